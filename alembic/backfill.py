@@ -0,0 +1,101 @@
+"""Helpers for migrations that fill in large tables.
+
+A single UPDATE or INSERT ... SELECT over a large, busy table holds its locks
+until the migration commits, which blocks the application's writes for as
+long as it runs. backfill_in_batches instead walks the table in key order and
+runs the backfill one batch of keys at a time. Each batch is its own short
+transaction, and each one gives up after lock_timeout rather than queueing
+behind (and in front of) the application's writes.
+
+env.py puts this directory on sys.path, so a migration can use it with
+
+    from backfill import backfill_in_batches, set_lock_timeout
+"""
+import logging
+import time
+
+import sqlalchemy as sa
+from alembic import op
+
+log = logging.getLogger('alembic.backfill')
+
+
+def set_lock_timeout(timeout: str, connection=None) -> None:
+    """Makes statements in the current transaction give up after waiting
+    `timeout` (a PostgreSQL interval such as '5s') for a lock. Only
+    PostgreSQL has lock timeouts; on other databases this does nothing."""
+    if connection is None:
+        if op.get_context().dialect.name == 'postgresql':
+            op.execute(f"SET LOCAL lock_timeout = '{timeout}'")
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(
+            sa.text("SELECT set_config('lock_timeout', :timeout, true)"),
+            {'timeout': timeout})
+
+
+def _is_lock_timeout(error: sa.exc.OperationalError) -> bool:
+    # 55P03 is PostgreSQL's lock_not_available; SQLite reports its own busy
+    # timeout as a locked database.
+    return (getattr(error.orig, 'pgcode', None) == '55P03'
+            or 'database is locked' in str(error.orig))
+
+
+def backfill_in_batches(table: str, key: str, statement: str, *,
+                        batch_size: int = 1000, lock_keys: bool = False,
+                        lock_timeout: str = '5s', max_retries: int = 5,
+                        retry_delay: float = 1.0) -> int:
+    """Runs `statement` over `table` one batch of at most `batch_size` rows
+    at a time, and returns the number of rows of `table` it covered.
+
+    `statement` is SQL text that backfills the rows whose `key` lies between
+    its :first and :last parameters (both inclusive). Batches follow `key`
+    order, picking up after the last key of the previous batch, so each batch
+    costs the same however far into the table it is. `key` must be unique.
+
+    Every batch runs and commits in its own transaction, outside the
+    migration's transaction (which is committed first; env.py runs each
+    migration in a transaction of its own). With `lock_keys`, the batch's
+    rows of `table` are locked FOR UPDATE before `statement` runs, which
+    holds off the writes that reference them (their foreign key checks lock
+    the rows FOR KEY SHARE) until the batch commits. A batch that times out waiting
+    for a lock is retried up to `max_retries` times.
+    """
+    context = op.get_context()
+    if context.as_sql:
+        raise RuntimeError(
+            f'the backfill of {table} needs a database connection; '
+            'run this migration without --sql')
+
+    keys = sa.table(table, sa.column(key))
+    total = 0
+    after = None
+    with context.autocommit_block():
+        with op.get_bind().engine.connect() as connection:
+            while True:
+                query = sa.select(keys.c[key]).order_by(keys.c[key]).limit(batch_size)
+                if after is not None:
+                    query = query.where(keys.c[key] > after)
+                if lock_keys:
+                    query = query.with_for_update()
+                for attempt in range(max_retries + 1):
+                    try:
+                        with connection.begin():
+                            set_lock_timeout(lock_timeout, connection)
+                            batch = connection.execute(query).scalars().all()
+                            if batch:
+                                connection.execute(
+                                    sa.text(statement),
+                                    {'first': batch[0], 'last': batch[-1]})
+                        break
+                    except sa.exc.OperationalError as e:
+                        if attempt == max_retries or not _is_lock_timeout(e):
+                            raise
+                        log.info('Batch of %s after %r timed out waiting for a '
+                                 'lock; retrying', table, after)
+                        time.sleep(retry_delay * (attempt + 1))
+                if not batch:
+                    break
+                total += len(batch)
+                after = batch[-1]
+                log.info('Backfilled %d rows of %s', total, table)
+    return total
@@ -0,0 +1,237 @@
+"""Seeds a local database and compares the hot queries before and after the
+index migration (7d3e1f9a2c64).
+
+    python alembic/benchmark_indexes.py [--url URL] [--projects N] [--repeat N]
+
+The database is migrated to the revision before the index migration, seeded
+with deterministic data, and every query below is EXPLAINed and timed; then it
+is upgraded to the index migration and the same queries run again. Without
+--url a throwaway SQLite file is used. A database given with --url must be
+empty, e.g. one just made with `createdb flastal_bench`, since the script creates
+the schema itself.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+
+BEFORE_REVISION = '509e28668f48'
+AFTER_REVISION = '7d3e1f9a2c64'
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'alembic.ini')
+
+# The queries behind the project page, the chats and the florist dashboard.
+QUERIES = [
+    ('project pledges',
+     'SELECT * FROM pledges WHERE project_id = :project_id '
+     'ORDER BY id DESC LIMIT 20'),
+    ('project pledge total',
+     'SELECT SUM(amount), COUNT(*) FROM pledges WHERE project_id = :project_id'),
+    ('user pledges',
+     'SELECT * FROM pledges WHERE user_id = :user_id'),
+    ('group chat page',
+     'SELECT * FROM group_chat_messages WHERE project_id = :project_id '
+     'ORDER BY "createdAt" DESC LIMIT 50'),
+    ('chat room page',
+     'SELECT * FROM chat_messages WHERE chat_room_id = :chat_room_id '
+     'ORDER BY "createdAt" DESC LIMIT 50'),
+    ('project offers',
+     'SELECT * FROM offers WHERE project_id = :project_id'),
+    ('florist pending offers',
+     "SELECT * FROM offers WHERE florist_id = :florist_id "
+     "AND status = 'PENDING'"),
+    ('user poll vote',
+     'SELECT * FROM poll_votes WHERE poll_id = :poll_id AND user_id = :user_id'),
+    ('quotation items',
+     'SELECT * FROM quotation_items WHERE quotation_id = :quotation_id'),
+    ('project announcements',
+     'SELECT * FROM announcements WHERE project_id = :project_id '
+     'ORDER BY "createdAt" DESC LIMIT 10'),
+]
+
+
+def _insert(connection, metadata, table, rows):
+    if rows:
+        connection.execute(metadata.tables[table].insert(), rows)
+
+
+def seed(engine, projects, seed=0):
+    """Fills the tables the queries read with the given number of projects' worth of
+    rows and returns the parameters to run the queries with."""
+    rng = random.Random(seed)
+    users = projects * 5
+    florists = max(1, projects // 10)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def at(minutes):
+        return start + timedelta(minutes=minutes)
+
+    metadata = sa.MetaData()
+    metadata.reflect(bind=engine)
+    with engine.begin() as connection:
+        _insert(connection, metadata, 'users', [
+            {'id': i, 'email': f'user{i}@example.com', 'handleName': f'user{i}',
+             'points': 0}
+            for i in range(1, users + 1)])
+        _insert(connection, metadata, 'florists', [
+            {'id': i, 'email': f'florist{i}@example.com', 'shopName': f'shop{i}',
+             'contactName': f'contact{i}', 'status': 'APPROVED', 'balance': 0}
+            for i in range(1, florists + 1)])
+        _insert(connection, metadata, 'projects', [
+            {'id': i, 'title': f'project {i}', 'targetAmount': 100000,
+             'collectedAmount': 0, 'status': 'FUNDRAISING',
+             'visibility': 'PUBLIC', 'planner_id': rng.randint(1, users)}
+            for i in range(1, projects + 1)])
+        _insert(connection, metadata, 'chat_rooms', [
+            {'id': i, 'project_id': i, 'florist_id': rng.randint(1, florists)}
+            for i in range(1, projects + 1)])
+        _insert(connection, metadata, 'polls', [
+            {'id': i, 'question': 'Which flowers?', 'project_id': i,
+             'creator_id': rng.randint(1, users), 'createdAt': at(i)}
+            for i in range(1, projects + 1)])
+        _insert(connection, metadata, 'quotations', [
+            {'id': i, 'totalAmount': 50000, 'project_id': i,
+             'florist_id': rng.randint(1, florists)}
+            for i in range(1, projects + 1)])
+
+        pledges, group_messages, chat_messages, votes = [], [], [], []
+        offers, items, announcements = [], [], []
+        for project in range(1, projects + 1):
+            for _ in range(rng.randint(10, 60)):
+                pledges.append({'amount': rng.randint(1, 100) * 100,
+                                'user_id': rng.randint(1, users),
+                                'project_id': project})
+            for _ in range(rng.randint(20, 120)):
+                group_messages.append({'content': 'hello',
+                                       'createdAt': at(rng.randint(0, 500000)),
+                                       'project_id': project,
+                                       'user_id': rng.randint(1, users)})
+            for _ in range(rng.randint(10, 80)):
+                chat_messages.append({'content': 'hello', 'sender_type': 'USER',
+                                      'sender_id': rng.randint(1, users),
+                                      'createdAt': at(rng.randint(0, 500000)),
+                                      'chat_room_id': project})
+            for user in rng.sample(range(1, users + 1),
+                                   rng.randint(0, min(30, users))):
+                votes.append({'option_index': rng.randint(0, 3),
+                              'poll_id': project, 'user_id': user})
+            for _ in range(rng.randint(1, 5)):
+                offers.append({'status': rng.choice(['PENDING', 'ACCEPTED',
+                                                     'REJECTED']),
+                               'project_id': project,
+                               'florist_id': rng.randint(1, florists),
+                               'chat_room_id': project})
+            for _ in range(rng.randint(3, 10)):
+                items.append({'itemName': 'rose', 'amount': 500,
+                              'quotation_id': project})
+            for _ in range(rng.randint(0, 8)):
+                announcements.append({'title': 'news', 'content': 'news',
+                                      'createdAt': at(rng.randint(0, 500000)),
+                                      'project_id': project})
+        _insert(connection, metadata, 'pledges', pledges)
+        _insert(connection, metadata, 'group_chat_messages', group_messages)
+        _insert(connection, metadata, 'chat_messages', chat_messages)
+        _insert(connection, metadata, 'poll_votes', votes)
+        _insert(connection, metadata, 'offers', offers)
+        _insert(connection, metadata, 'quotation_items', items)
+        _insert(connection, metadata, 'announcements', announcements)
+
+    project = rng.randint(1, projects)
+    return {'project_id': project, 'chat_room_id': project, 'poll_id': project,
+            'quotation_id': project, 'user_id': rng.randint(1, users),
+            'florist_id': rng.randint(1, florists)}
+
+
+def explain(connection, sql, params):
+    """Returns the query plan of |sql| as text."""
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(
+            sa.text('EXPLAIN (ANALYZE, BUFFERS) ' + sql), params)
+        return '\n'.join(row[0] for row in rows)
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(sa.text('EXPLAIN QUERY PLAN ' + sql), params)
+        return '\n'.join(row[-1] for row in rows)
+    rows = connection.execute(sa.text('EXPLAIN ' + sql), params)
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def measure(engine, params, repeat):
+    """Returns {name: (median milliseconds, plan)} for every query."""
+    results = {}
+    with engine.connect() as connection:
+        # Refresh the planner's statistics, so that it knows about the rows
+        # just seeded and the indexes just built.
+        if connection.dialect.name in ('postgresql', 'sqlite'):
+            connection.execute(sa.text('ANALYZE'))
+        for name, sql in QUERIES:
+            query = sa.text(sql)
+            timings = []
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                connection.execute(query, params).fetchall()
+                timings.append((time.perf_counter() - begin) * 1000)
+            results[name] = (statistics.median(timings),
+                             explain(connection, sql, params))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help='SQLAlchemy URL of an empty database '
+                        '(default: a temporary SQLite file)')
+    parser.add_argument('--projects', type=int, default=2000,
+                        help='number of projects to seed (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='runs of each query to take the median of '
+                        '(default: %(default)s)')
+    parser.add_argument('--plans', action='store_true',
+                        help='print the query plans too')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = 'sqlite:///' + os.path.join(tmpdir.name, 'bench.db')
+    engine = sa.create_engine(url)
+    if sa.inspect(engine).get_table_names():
+        parser.error(f'{engine.url!r} is not empty')
+
+    # env.py takes the database from DATABASE_URL.
+    os.environ['DATABASE_URL'] = url
+    config = Config(ALEMBIC_INI)
+    command.upgrade(config, BEFORE_REVISION)
+    params = seed(engine, args.projects)
+    before = measure(engine, params, args.repeat)
+    command.upgrade(config, AFTER_REVISION)
+    after = measure(engine, params, args.repeat)
+
+    print(f'{"query":<24} {"before ms":>10} {"after ms":>10} {"speedup":>8}')
+    for name, _ in QUERIES:
+        before_ms, before_plan = before[name]
+        after_ms, after_plan = after[name]
+        print(f'{name:<24} {before_ms:>10.3f} {after_ms:>10.3f} '
+              f'{before_ms / max(after_ms, 1e-9):>7.1f}x')
+        if args.plans:
+            for label, plan in (('before', before_plan), ('after', after_plan)):
+                print(f'  {label}:')
+                for line in plan.splitlines():
+                    print('    ' + line)
+
+    engine.dispose()
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
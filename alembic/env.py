@@ -26,7 +26,18 @@ sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'
 
 # --- 2. あなたのモデル定義をインポートします ---
 # これで、server/models.py から Base を見つけられるようになります。
-from models import Base
+# models.py が無くても upgrade / downgrade（と alembic/benchmark_indexes.py）は動きます。
+# その場合、--autogenerate だけは比べるモデルが無いので使えません。
+try:
+    from models import Base
+except ModuleNotFoundError as e:
+    if e.name != 'models':
+        raise
+    Base = None
+
+# --- 3. マイグレーション用のヘルパー（backfill.py など）を import できるようにします ---
+# versions/ 内のマイグレーションから `from backfill import backfill_in_batches` と書けます。
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__)))
 
 # ==================================================================
 # ▲▲▲ ここまでが修正箇所です ▲▲▲
@@ -46,7 +57,7 @@ if config.config_file_name is not None:
 
 # あなたのモデルのMetaDataオブジェクトをここに設定します
 # これにより、Alembicはあなたのテーブル定義を認識できます
-target_metadata = Base.metadata
+target_metadata = Base.metadata if Base is not None else None
 
 # その他のAlembic設定（通常は変更不要です）
 
@@ -58,6 +69,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -74,8 +86,16 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # マイグレーションごとに別々のトランザクションで実行し、1つ終わるたびにコミットします。
+        # 全体を1つのトランザクションで実行すると、長いバックフィルの間ずっと
+        # 前のマイグレーションが取ったロックが残り、よく使うテーブルへの書き込みが止まります。
+        # 各マイグレーションの中では op.get_context().autocommit_block() で
+        # トランザクションの外に出られます（backfill.py の backfill_in_batches はこれを使って
+        # バッチごとにコミットします）。
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,187 @@
+"""Add trigger-maintained project funding stats
+
+Revision ID: 41f7ed45fda8
+Revises: 7d3e1f9a2c64
+Create Date: 2026-10-16 14:37:05.218664
+
+project_funding_stats holds each project's pledge total, pledge count and the
+time of its last pledge, so listings and progress bars can read them instead
+of trusting projects.collectedAmount or summing pledges on every request.
+Triggers on pledges keep it in step with every insert, delete and change of
+amount or project. pledges has no timestamp, so lastPledgedAt is only known
+for pledges made after this migration. A project without a row has no pledges.
+
+The existing pledges are backfilled a batch of projects at a time after the
+triggers are in place. Each batch locks its projects FOR UPDATE, which makes
+new pledges to them (whose foreign key checks take FOR KEY SHARE, as does the
+trigger for deleted and moved pledges) wait until the batch has recounted
+them and committed, so no pledge is counted twice or missed.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from backfill import backfill_in_batches, set_lock_timeout
+
+
+# revision identifiers, used by Alembic.
+revision: str = '41f7ed45fda8'
+down_revision: Union[str, Sequence[str], None] = '7d3e1f9a2c64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+POSTGRESQL_FUNCTION = """
+    CREATE OR REPLACE FUNCTION project_funding_stats_on_pledge()
+    RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.project_id IS NOT NULL THEN
+            PERFORM 1 FROM projects WHERE id = OLD.project_id FOR KEY SHARE;
+            UPDATE project_funding_stats
+               SET "totalAmount" = "totalAmount" - OLD.amount,
+                   "pledgeCount" = "pledgeCount" - 1
+             WHERE project_id = OLD.project_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.project_id IS NOT NULL THEN
+            INSERT INTO project_funding_stats
+                   (project_id, "totalAmount", "pledgeCount", "lastPledgedAt")
+            VALUES (NEW.project_id, NEW.amount, 1,
+                    CASE WHEN TG_OP = 'INSERT' THEN now() END)
+            ON CONFLICT (project_id) DO UPDATE
+               SET "totalAmount" = project_funding_stats."totalAmount"
+                                   + excluded."totalAmount",
+                   "pledgeCount" = project_funding_stats."pledgeCount" + 1,
+                   "lastPledgedAt" = COALESCE(excluded."lastPledgedAt",
+                                              project_funding_stats."lastPledgedAt");
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# (name, statement) of the triggers on pledges, by dialect.
+POSTGRESQL_TRIGGERS = [
+    ('project_funding_stats_pledge_insert_delete', """
+    CREATE TRIGGER project_funding_stats_pledge_insert_delete
+    AFTER INSERT OR DELETE ON pledges
+    FOR EACH ROW EXECUTE FUNCTION project_funding_stats_on_pledge()
+    """),
+    ('project_funding_stats_pledge_update', """
+    CREATE TRIGGER project_funding_stats_pledge_update
+    AFTER UPDATE OF amount, project_id ON pledges
+    FOR EACH ROW
+    WHEN (OLD.amount IS DISTINCT FROM NEW.amount
+          OR OLD.project_id IS DISTINCT FROM NEW.project_id)
+    EXECUTE FUNCTION project_funding_stats_on_pledge()
+    """),
+]
+
+SQLITE_TRIGGERS = [
+    ('project_funding_stats_pledge_insert', """
+    CREATE TRIGGER project_funding_stats_pledge_insert
+    AFTER INSERT ON pledges WHEN NEW.project_id IS NOT NULL
+    BEGIN
+        INSERT INTO project_funding_stats
+               (project_id, "totalAmount", "pledgeCount", "lastPledgedAt")
+        VALUES (NEW.project_id, NEW.amount, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (project_id) DO UPDATE
+           SET "totalAmount" = "totalAmount" + excluded."totalAmount",
+               "pledgeCount" = "pledgeCount" + 1,
+               "lastPledgedAt" = excluded."lastPledgedAt";
+    END
+    """),
+    ('project_funding_stats_pledge_delete', """
+    CREATE TRIGGER project_funding_stats_pledge_delete
+    AFTER DELETE ON pledges WHEN OLD.project_id IS NOT NULL
+    BEGIN
+        UPDATE project_funding_stats
+           SET "totalAmount" = "totalAmount" - OLD.amount,
+               "pledgeCount" = "pledgeCount" - 1
+         WHERE project_id = OLD.project_id;
+    END
+    """),
+    ('project_funding_stats_pledge_update', """
+    CREATE TRIGGER project_funding_stats_pledge_update
+    AFTER UPDATE OF amount, project_id ON pledges
+    WHEN OLD.amount IS NOT NEW.amount OR OLD.project_id IS NOT NEW.project_id
+    BEGIN
+        UPDATE project_funding_stats
+           SET "totalAmount" = "totalAmount" - OLD.amount,
+               "pledgeCount" = "pledgeCount" - 1
+         WHERE project_id = OLD.project_id;
+        INSERT INTO project_funding_stats
+               (project_id, "totalAmount", "pledgeCount")
+        SELECT NEW.project_id, NEW.amount, 1 WHERE NEW.project_id IS NOT NULL
+        ON CONFLICT (project_id) DO UPDATE
+           SET "totalAmount" = "totalAmount" + excluded."totalAmount",
+               "pledgeCount" = "pledgeCount" + 1;
+    END
+    """),
+]
+
+TRIGGERS = {'postgresql': POSTGRESQL_TRIGGERS, 'sqlite': SQLITE_TRIGGERS}
+
+# Recounts the pledges of the projects with ids :first to :last. Rows the
+# triggers already made are overwritten with the full count, but keep the
+# lastPledgedAt they recorded.
+BACKFILL = """
+    INSERT INTO project_funding_stats (project_id, "totalAmount", "pledgeCount")
+    SELECT projects.id, COALESCE(SUM(pledges.amount), 0), COUNT(pledges.id)
+      FROM projects LEFT JOIN pledges ON pledges.project_id = projects.id
+     WHERE projects.id BETWEEN :first AND :last
+     GROUP BY projects.id
+    ON CONFLICT (project_id) DO UPDATE
+       SET "totalAmount" = excluded."totalAmount",
+           "pledgeCount" = excluded."pledgeCount"
+"""
+
+
+def _drop_trigger(dialect: str, name: str) -> None:
+    if dialect == 'postgresql':
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON pledges')
+    else:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Check before any DDL runs, so that nothing is left half made on a
+    # database the triggers aren't written for.
+    dialect = op.get_context().dialect.name
+    if dialect not in TRIGGERS:
+        raise RuntimeError(
+            f'project_funding_stats is kept up to date by triggers, which are '
+            f'only written for {" and ".join(TRIGGERS)}, not {dialect}')
+    # The backfill commits the table and the triggers before alembic records
+    # this revision, so every step tolerates what an earlier, failed run of
+    # this upgrade left behind, and the backfill recounts every project.
+    op.create_table('project_funding_stats',
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('totalAmount', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('pledgeCount', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('lastPledgedAt', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('project_id'),
+    if_not_exists=True
+    )
+    # Creating the triggers locks pledges against writes, so don't wait
+    # behind a long transaction with every new pledge queued up behind us.
+    set_lock_timeout('5s')
+    if dialect == 'postgresql':
+        op.execute(POSTGRESQL_FUNCTION)
+    for name, statement in TRIGGERS[dialect]:
+        _drop_trigger(dialect, name)
+        op.execute(statement)
+    backfill_in_batches('projects', 'id', BACKFILL, lock_keys=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_context().dialect.name
+    set_lock_timeout('5s')
+    for name, _ in reversed(TRIGGERS.get(dialect, [])):
+        _drop_trigger(dialect, name)
+    if dialect == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS project_funding_stats_on_pledge()')
+    op.drop_table('project_funding_stats', if_exists=True)
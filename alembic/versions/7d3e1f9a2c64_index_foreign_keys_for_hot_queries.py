@@ -0,0 +1,115 @@
+"""Index foreign keys for hot queries and drop redundant primary key indexes
+
+Revision ID: 7d3e1f9a2c64
+Revises: 509e28668f48
+Create Date: 2026-10-16 10:12:41.508213
+
+The initial schema indexed every primary key a second time (ix_<table>_id)
+but none of the foreign keys the API filters on, so listing a project's
+pledges, a chat room's messages or a florist's offers scanned the whole table.
+
+On PostgreSQL the indexes are built and dropped with CONCURRENTLY inside an
+autocommit block, so writes to the tables carry on while they are built. A
+concurrent build that fails leaves an invalid index behind, so every index is
+dropped (if it exists) right before it is built, which makes a failed upgrade
+or downgrade safe to re-run. Other databases build them inside the migration's
+own transaction.
+"""
+from contextlib import nullcontext
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3e1f9a2c64'
+down_revision: Union[str, Sequence[str], None] = '509e28668f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns) of the indexes behind the hot queries. A composite
+# index leads with the foreign key the query filters on and continues with the
+# column it sorts or also filters by, so one index scan returns the rows in
+# order. pledges has no timestamp, so its id stands in for the pledge order.
+ACCESS_PATH_INDEXES = [
+    ('ix_pledges_project_id_id', 'pledges', ['project_id', 'id']),
+    ('ix_pledges_user_id', 'pledges', ['user_id']),
+    ('ix_group_chat_messages_project_id_createdAt', 'group_chat_messages',
+     ['project_id', 'createdAt']),
+    ('ix_chat_messages_chat_room_id_createdAt', 'chat_messages',
+     ['chat_room_id', 'createdAt']),
+    ('ix_offers_project_id', 'offers', ['project_id']),
+    ('ix_offers_florist_id_status', 'offers', ['florist_id', 'status']),
+    ('ix_poll_votes_poll_id_user_id', 'poll_votes', ['poll_id', 'user_id']),
+    ('ix_quotation_items_quotation_id', 'quotation_items', ['quotation_id']),
+    ('ix_announcements_project_id_createdAt', 'announcements',
+     ['project_id', 'createdAt']),
+]
+
+# Tables whose ix_<table>_id index duplicates the one behind the primary key.
+PRIMARY_KEY_INDEX_TABLES = [
+    'announcements',
+    'chat_messages',
+    'chat_rooms',
+    'chat_templates',
+    'commissions',
+    'expenses',
+    'florists',
+    'group_chat_messages',
+    'messages',
+    'offers',
+    'payouts',
+    'pledges',
+    'poll_options',
+    'poll_votes',
+    'polls',
+    'projects',
+    'quotation_items',
+    'quotations',
+    'reports',
+    'reviews',
+    'tasks',
+    'users',
+    'venues',
+]
+
+
+def _index_block():
+    """Returns the block the index changes run in: an autocommit block on
+    PostgreSQL, where CONCURRENTLY can't run inside a transaction, and the
+    migration's transaction everywhere else."""
+    context = op.get_context()
+    if context.dialect.name == 'postgresql':
+        return context.autocommit_block()
+    return nullcontext()
+
+
+def _drop_index(name: str, table: str) -> None:
+    op.drop_index(op.f(name), table_name=table, if_exists=True,
+                  postgresql_concurrently=True)
+
+
+def _create_index(name: str, table: str, columns: list) -> None:
+    _drop_index(name, table)
+    op.create_index(op.f(name), table, columns, unique=False,
+                    postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with _index_block():
+        for name, table, columns in ACCESS_PATH_INDEXES:
+            _create_index(name, table, columns)
+        for table in PRIMARY_KEY_INDEX_TABLES:
+            _drop_index(f'ix_{table}_id', table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with _index_block():
+        for table in reversed(PRIMARY_KEY_INDEX_TABLES):
+            _create_index(f'ix_{table}_id', table, ['id'])
+        for name, table, columns in reversed(ACCESS_PATH_INDEXES):
+            _drop_index(name, table)